@@ -5,26 +5,113 @@ Handles storage and retrieval of known people and their embeddings.
 
 import sqlite3
 import json
+import logging
 import numpy as np
 from typing import Optional, List, Tuple
 from pathlib import Path
 import threading
 
+log = logging.getLogger(__name__)
+
+# Optional sqlite-vec extension for C-side KNN search
+try:
+    import sqlite_vec
+    SQLITE_VEC_AVAILABLE = True
+except ImportError:
+    SQLITE_VEC_AVAILABLE = False
+    log.warning("sqlite-vec not installed, falling back to in-Python matching")
+
+# Optional blosc2 for compressed on-disk embeddings (SIMD shuffle + zstd)
+try:
+    import blosc2
+    BLOSC2_AVAILABLE = True
+except ImportError:
+    BLOSC2_AVAILABLE = False
+
+# Embedding BLOB format tags (first byte); rows without a tag are
+# raw float32 from before compression support
+_FMT_RAW = b"\x01"
+_FMT_BLOSC = b"\x02"
+
 # Thread-local storage for database connections
 _local = threading.local()
 
+# Set once the vec_faces virtual table has been created successfully
+_vec_enabled = False
+
 # Database file path
 DB_PATH = Path(__file__).parent / "remindar.db"
 
 
+def _configure_connection(conn: sqlite3.Connection):
+    """
+    Tune a fresh connection for the read-heavy gallery workload:
+    WAL + relaxed fsync, memory-mapped reads, and a bigger page cache.
+    """
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+        conn.execute("PRAGMA cache_size=-65536")    # 64MB
+        conn.execute("PRAGMA temp_store=MEMORY")
+    except sqlite3.Error as e:
+        # mmap isn't available everywhere; defaults still work
+        log.warning("PRAGMA setup failed: %s", e)
+
+
 def get_connection() -> sqlite3.Connection:
     """Get a thread-local database connection."""
     if not hasattr(_local, "connection"):
         _local.connection = sqlite3.connect(str(DB_PATH), check_same_thread=False)
         _local.connection.row_factory = sqlite3.Row
+        _configure_connection(_local.connection)
+        if SQLITE_VEC_AVAILABLE:
+            try:
+                _local.connection.enable_load_extension(True)
+                sqlite_vec.load(_local.connection)
+                _local.connection.enable_load_extension(False)
+            except Exception as e:
+                log.warning("sqlite-vec load failed: %s", e)
     return _local.connection
 
 
+def _embedding_to_blob(embedding: np.ndarray) -> sqlite3.Binary:
+    """Serialize an embedding to a tagged BLOB (compressed when blosc2 is available)."""
+    raw = np.ascontiguousarray(embedding, dtype=np.float32).tobytes()
+    if BLOSC2_AVAILABLE:
+        compressed = blosc2.compress2(
+            raw,
+            codec=blosc2.Codec.ZSTD,
+            filters=[blosc2.Filter.SHUFFLE],
+        )
+        return sqlite3.Binary(_FMT_BLOSC + compressed)
+    return sqlite3.Binary(_FMT_RAW + raw)
+
+
+def _vec_blob(embedding: np.ndarray) -> sqlite3.Binary:
+    """Raw float32 bytes for the vec0 index (which does its own storage)."""
+    return sqlite3.Binary(np.ascontiguousarray(embedding, dtype=np.float32).tobytes())
+
+
+def _blob_to_embedding(blob) -> np.ndarray:
+    """Deserialize a stored embedding back to a float32 array."""
+    if isinstance(blob, str):
+        # Legacy row: JSON-serialized list from the old TEXT schema
+        return np.asarray(json.loads(blob), dtype=np.float32)
+
+    blob = bytes(blob)
+    tag = blob[:1]
+    try:
+        if tag == _FMT_BLOSC and BLOSC2_AVAILABLE:
+            return np.frombuffer(blosc2.decompress2(blob[1:]), dtype=np.float32)
+        if tag == _FMT_RAW and (len(blob) - 1) % 4 == 0:
+            return np.frombuffer(blob, dtype=np.float32, offset=1)
+    except Exception:
+        pass
+    # Untagged row: raw float32 bytes (always a multiple of 4)
+    return np.frombuffer(blob, dtype=np.float32)
+
+
 def init_database():
     """
     Initialize the database schema.
@@ -32,9 +119,9 @@ def init_database():
     """
     conn = get_connection()
     cursor = conn.cursor()
-    
+
     # Main table for known people
-    # Embeddings stored as JSON-serialized arrays for simplicity
+    # Embeddings stored as raw float32 BLOBs (512 * 4 bytes per face)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS people (
             id TEXT PRIMARY KEY,
@@ -42,19 +129,91 @@ def init_database():
             relation TEXT NOT NULL,
             last_met TEXT NOT NULL,
             context TEXT NOT NULL,
-            embedding TEXT,
+            embedding BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    
+
     # Index for faster name lookups
     cursor.execute("""
         CREATE INDEX IF NOT EXISTS idx_people_name ON people(name)
     """)
-    
+
+    # Migrate legacy rows that still hold JSON text embeddings
+    cursor.execute("SELECT id, embedding FROM people WHERE embedding IS NOT NULL")
+    for row in cursor.fetchall():
+        if isinstance(row["embedding"], str):
+            conn.execute(
+                "UPDATE people SET embedding = ? WHERE id = ?",
+                (_embedding_to_blob(np.asarray(json.loads(row["embedding"]))), row["id"])
+            )
+
+    # Vector index for KNN face matching (optional, needs sqlite-vec)
+    global _vec_enabled
+    if SQLITE_VEC_AVAILABLE:
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS vec_faces USING vec0(
+                    person_id TEXT PRIMARY KEY,
+                    embedding FLOAT[512] distance_metric=cosine
+                )
+            """)
+            _vec_enabled = True
+            _rebuild_vec_index(conn)
+        except sqlite3.OperationalError as e:
+            log.warning("vec_faces unavailable: %s", e)
+            _vec_enabled = False
+
     conn.commit()
-    print(f"[DB] Database initialized at {DB_PATH}")
+    log.info("Database initialized at %s", DB_PATH)
+
+
+def _rebuild_vec_index(conn: sqlite3.Connection):
+    """Repopulate the vec_faces index from the people table."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM vec_faces")
+    cursor.execute("SELECT id, embedding FROM people WHERE embedding IS NOT NULL")
+    for row in cursor.fetchall():
+        conn.execute(
+            "INSERT INTO vec_faces (person_id, embedding) VALUES (?, ?)",
+            (row["id"], _vec_blob(_blob_to_embedding(row["embedding"])))
+        )
+
+
+def _upsert_vec_entry(conn: sqlite3.Connection, person_id: str, embedding: np.ndarray):
+    """Insert or replace a single row in the vec_faces index."""
+    if not _vec_enabled:
+        return
+    conn.execute("DELETE FROM vec_faces WHERE person_id = ?", (person_id,))
+    conn.execute(
+        "INSERT INTO vec_faces (person_id, embedding) VALUES (?, ?)",
+        (person_id, _vec_blob(embedding))
+    )
+
+
+def vec_search(query_embedding: np.ndarray) -> Optional[Tuple[str, float]]:
+    """
+    KNN search against the vec_faces index.
+    Returns (person_id, cosine_distance) for the nearest face,
+    or None when the index is unavailable or empty.
+    """
+    if not _vec_enabled:
+        return None
+
+    conn = get_connection()
+    try:
+        row = conn.execute("""
+            SELECT person_id, distance FROM vec_faces
+            WHERE embedding MATCH ? AND k = 1
+        """, (_vec_blob(query_embedding),)).fetchone()
+    except sqlite3.OperationalError as e:
+        log.warning("vec search failed: %s", e)
+        return None
+
+    if row is None:
+        return None
+    return row["person_id"], float(row["distance"])
 
 
 def add_person(
@@ -63,30 +222,35 @@ def add_person(
     relation: str,
     last_met: str,
     context: str,
-    embedding: Optional[np.ndarray] = None
+    embedding: Optional[np.ndarray] = None,
+    commit: bool = True
 ) -> bool:
     """
     Add a new person to the database.
     Returns True if successful, False if ID already exists.
+    Pass commit=False when batching inserts inside a caller's transaction.
     """
     conn = get_connection()
     cursor = conn.cursor()
     
-    # Serialize embedding to JSON if provided
-    embedding_json = None
+    # Serialize embedding to raw bytes if provided
+    embedding_blob = None
     if embedding is not None:
-        embedding_json = json.dumps(embedding.tolist())
-    
+        embedding_blob = _embedding_to_blob(embedding)
+
     try:
         cursor.execute("""
             INSERT INTO people (id, name, relation, last_met, context, embedding)
             VALUES (?, ?, ?, ?, ?, ?)
-        """, (person_id, name, relation, last_met, context, embedding_json))
-        conn.commit()
-        print(f"[DB] Added person: {name} ({person_id})")
+        """, (person_id, name, relation, last_met, context, embedding_blob))
+        if embedding is not None:
+            _upsert_vec_entry(conn, person_id, embedding)
+        if commit:
+            conn.commit()
+        log.debug("Added person: %s (%s)", name, person_id)
         return True
     except sqlite3.IntegrityError:
-        print(f"[DB] Person already exists: {person_id}")
+        log.debug("Person already exists: %s", person_id)
         return False
 
 
@@ -109,7 +273,7 @@ def update_person(
     conn.commit()
     
     if cursor.rowcount > 0:
-        print(f"[DB] Updated person: {name} ({person_id})")
+        log.debug("Updated person: %s (%s)", name, person_id)
         return True
     return False
 
@@ -119,30 +283,37 @@ def update_embedding(person_id: str, embedding: np.ndarray) -> bool:
     conn = get_connection()
     cursor = conn.cursor()
     
-    embedding_json = json.dumps(embedding.tolist())
-    
+    embedding_blob = _embedding_to_blob(embedding)
+
     cursor.execute("""
-        UPDATE people 
+        UPDATE people
         SET embedding = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
-    """, (embedding_json, person_id))
-    
+    """, (embedding_blob, person_id))
+
     success = cursor.rowcount > 0
+    if success:
+        _upsert_vec_entry(conn, person_id, embedding)
     conn.commit()
     
     if success:
-        print(f"[DB] Updated embedding for: {person_id}")
+        log.debug("Updated embedding for: %s", person_id)
     return success
 
 
 def get_person(person_id: str) -> Optional[dict]:
-    """Get a person by ID."""
+    """Get a person by ID (without the embedding blob)."""
     conn = get_connection()
     cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM people WHERE id = ?", (person_id,))
+
+    # The embedding is a raw BLOB; leaving it out keeps these dicts
+    # JSON-serializable for broadcasts and API responses
+    cursor.execute(
+        "SELECT id, name, relation, last_met, context FROM people WHERE id = ?",
+        (person_id,)
+    )
     row = cursor.fetchone()
-    
+
     if row:
         return dict(row)
     return None
@@ -156,20 +327,26 @@ def get_all_people_with_embeddings() -> List[Tuple[dict, Optional[np.ndarray]]]:
     """
     conn = get_connection()
     cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM people WHERE embedding IS NOT NULL")
-    rows = cursor.fetchall()
-    
+
+    # Fixed column order so rows unpack straight into locals —
+    # no Row -> dict copy and no embedding pop per row
+    cursor.execute("""
+        SELECT id, name, relation, last_met, context, embedding
+        FROM people WHERE embedding IS NOT NULL
+    """)
+
     results = []
-    for row in rows:
-        person = dict(row)
-        embedding = None
-        if person.get("embedding"):
-            embedding = np.array(json.loads(person["embedding"]))
-        # Remove embedding from person dict (not needed in response)
-        person.pop("embedding", None)
+    for person_id, name, relation, last_met, context, emb_blob in cursor:
+        person = {
+            "id": person_id,
+            "name": name,
+            "relation": relation,
+            "last_met": last_met,
+            "context": context,
+        }
+        embedding = _blob_to_embedding(emb_blob) if emb_blob else None
         results.append((person, embedding))
-    
+
     return results
 
 
@@ -189,10 +366,12 @@ def delete_person(person_id: str) -> bool:
     
     cursor.execute("DELETE FROM people WHERE id = ?", (person_id,))
     success = cursor.rowcount > 0
+    if _vec_enabled:
+        cursor.execute("DELETE FROM vec_faces WHERE person_id = ?", (person_id,))
     conn.commit()
     
     if success:
-        print(f"[DB] Deleted person: {person_id}")
+        log.debug("Deleted person: %s", person_id)
     return success
 
 
@@ -232,16 +411,19 @@ def seed_demo_data():
         }
     ]
     
-    for person in demo_people:
-        add_person(
-            person_id=person["id"],
-            name=person["name"],
-            relation=person["relation"],
-            last_met=person["last_met"],
-            context=person["context"]
-        )
-    
-    print(f"[DB] Seeded {len(demo_people)} demo identities")
+    conn = get_connection()
+    with conn:
+        for person in demo_people:
+            add_person(
+                person_id=person["id"],
+                name=person["name"],
+                relation=person["relation"],
+                last_met=person["last_met"],
+                context=person["context"],
+                commit=False
+            )
+
+    log.info("Seeded %d demo identities", len(demo_people))
 
 
 def clear_all_people():
@@ -249,8 +431,10 @@ def clear_all_people():
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM people")
+    if _vec_enabled:
+        cursor.execute("DELETE FROM vec_faces")
     conn.commit()
-    print("[DB] Cleared all people from database")
+    log.info("Cleared all people from database")
 
 
 def sync_from_firestore(firestore_people: list):
@@ -259,38 +443,40 @@ def sync_from_firestore(firestore_people: list):
     Clears existing data and replaces with Firestore data.
     """
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Clear existing data
-    cursor.execute("DELETE FROM people")
-    
-    synced = 0
+
+    # Build all rows up front so the write is one executemany
+    rows = []
     for person in firestore_people:
         person_id = person.get("id")
         if not person_id:
             continue
-            
+
         # Get embedding if available
-        embedding_json = None
+        embedding_blob = None
         if "embedding" in person and person["embedding"]:
-            embedding_json = json.dumps(person["embedding"])
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO people (id, name, relation, last_met, context, embedding)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
+            embedding_blob = _embedding_to_blob(np.asarray(person["embedding"]))
+
+        rows.append((
             person_id,
             person.get("name", ""),
             person.get("relation", ""),
             person.get("last_met", ""),
             person.get("context", ""),
-            embedding_json
+            embedding_blob
         ))
-        synced += 1
-    
-    conn.commit()
-    print(f"[DB] Synced {synced} people from Firestore to SQLite")
-    return synced
+
+    # Single transaction: one fsync for the whole sync
+    with conn:
+        conn.execute("DELETE FROM people")
+        conn.executemany("""
+            INSERT OR REPLACE INTO people (id, name, relation, last_met, context, embedding)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        if _vec_enabled:
+            _rebuild_vec_index(conn)
+
+    log.info("Synced %d people from Firestore to SQLite", len(rows))
+    return len(rows)
 
 
 # Initialize on import
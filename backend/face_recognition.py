@@ -3,14 +3,19 @@ Face recognition module for RemindAR.
 Uses InsightFace for embeddings - session-only cache from Firestore.
 """
 
+import os
+import time
+import threading
 import numpy as np
 import cv2
 import base64
+import logging
+from collections import OrderedDict
 from typing import Optional, Tuple, Dict
-from io import BytesIO
-from PIL import Image
 import warnings
 
+log = logging.getLogger(__name__)
+
 # Suppress the FutureWarning from insightface
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -20,7 +25,47 @@ try:
     INSIGHTFACE_AVAILABLE = True
 except ImportError:
     INSIGHTFACE_AVAILABLE = False
-    print("[WARN] InsightFace not installed")
+    log.warning("InsightFace not installed")
+
+# Optional numba JIT for the brute-force gallery scan
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Optional faiss for SIMD / sub-linear similarity search
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# pybase64 decodes with SIMD (~4-7x stdlib) — worthwhile since text
+# clients ship every face crop base64-encoded
+try:
+    from pybase64 import b64decode as _b64decode
+except ImportError:
+    _b64decode = base64.b64decode
+
+
+if NUMBA_AVAILABLE:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _argmax_cosine(query, gallery):
+        """Best row index and dot product of query against the gallery."""
+        n = gallery.shape[0]
+        d = gallery.shape[1]
+        scores = np.empty(n, dtype=np.float32)
+        for i in numba.prange(n):
+            s = np.float32(0.0)
+            for j in range(d):
+                s += gallery[i, j] * query[j]
+            scores[i] = s
+        best_idx = 0
+        for i in range(1, n):
+            if scores[i] > scores[best_idx]:
+                best_idx = i
+        return best_idx, scores[best_idx]
 
 
 class FaceRecognizer:
@@ -30,27 +75,134 @@ class FaceRecognizer:
     """
     
     SIMILARITY_THRESHOLD = 0.55  # 55% for lenient matching
-    
+
+    # Same threshold in cosine-distance form (d = 1 - cos), precomputed so
+    # the vec-index path compares distances directly without converting
+    # every candidate back to a similarity
+    DISTANCE_THRESHOLD = 1.0 - SIMILARITY_THRESHOLD
+
+    # Quantize the gallery to int8 above this size; smaller galleries
+    # aren't memory-bound so FP32 stays exact for free
+    INT8_GALLERY_MIN = 256
+
+    # faiss: exact IndexFlatIP below this, HNSW (sub-linear) above it
+    HNSW_GALLERY_MIN = 1024
+
+    # Query-embedding cache: near-duplicate video frames skip the ONNX pass
+    QUERY_CACHE_SIZE = 512
+    QUERY_CACHE_TTL = 10.0  # seconds
+
     def __init__(self):
         self.model = None
         self._cache: Dict[str, Tuple[dict, np.ndarray]] = {}
+        # Perceptual-hash -> (timestamp, embedding), LRU order.
+        # Mutated from multiple executor threads (batcher + batch
+        # endpoint), so every access holds the lock
+        self._query_cache: "OrderedDict[bytes, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # Gallery snapshot: (ids, matrix, int8, faiss index) built as
+        # one tuple and swapped with a single assignment, so readers on
+        # executor threads never pair a new matrix with stale ids
+        self._gallery: Optional[tuple] = None
+        # Bumped on any cache mutation; lets callers key derived caches
+        # (e.g. serialized WS payloads) so they can never serve stale data
+        self.cache_version = 0
         self._initialize_model()
+
+    def _rebuild_gallery(self):
+        """Rebuild the stacked gallery snapshot from the cache."""
+        self.cache_version += 1
+        if not self._cache:
+            self._gallery = None
+            return
+
+        # Cache entries are normalized on insert, so stacking is enough
+        ids = list(self._cache.keys())
+        matrix = np.stack([self._cache[pid][1] for pid in ids])
+
+        # Large galleries: 4x less bandwidth via int8, well within the
+        # accuracy margin of the 0.55 threshold
+        if len(ids) >= self.INT8_GALLERY_MIN:
+            gallery_int8 = self._quantize_int8(matrix)
+        else:
+            gallery_int8 = None
+
+        # Rebuilding on every cache change is fine: registration is rare
+        # compared to per-frame searches
+        index = None
+        if FAISS_AVAILABLE:
+            dim = matrix.shape[1]
+            if len(ids) >= self.HNSW_GALLERY_MIN:
+                index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexFlatIP(dim)
+            index.add(matrix)
+
+        # Single assignment swaps in the whole consistent snapshot
+        self._gallery = (ids, matrix, gallery_int8, index)
+
+    def _gallery_snapshot(self) -> Optional[tuple]:
+        """Current gallery snapshot, rebuilding it if needed."""
+        gallery = self._gallery
+        if gallery is None and self._cache:
+            self._rebuild_gallery()
+            gallery = self._gallery
+        return gallery
+
+    @staticmethod
+    def _quantize_int8(vectors: np.ndarray) -> np.ndarray:
+        """Quantize unit-norm float32 vectors to int8 with scale 127."""
+        return np.round(vectors * 127.0).clip(-127, 127).astype(np.int8)
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        """L2-normalize an embedding; no-op for already unit-length vectors."""
+        norm = float(np.linalg.norm(embedding))
+        if np.isclose(norm, 1.0):
+            return np.asarray(embedding, dtype=np.float32)
+        return np.asarray(embedding / (norm + 1e-8), dtype=np.float32)
     
+    # Execution providers in preference order; filtered against what the
+    # local onnxruntime build actually ships
+    PREFERRED_PROVIDERS = [
+        "CUDAExecutionProvider",
+        "OpenVINOExecutionProvider",
+        "DmlExecutionProvider",
+        "CPUExecutionProvider",
+    ]
+
+    def _select_providers(self) -> list:
+        """Pick the fastest available ONNX execution providers."""
+        try:
+            import onnxruntime
+
+            available = set(onnxruntime.get_available_providers())
+            providers = [p for p in self.PREFERRED_PROVIDERS if p in available]
+            if providers:
+                return providers
+        except Exception as e:
+            log.warning("Provider detection failed: %s", e)
+        return ["CPUExecutionProvider"]
+
     def _initialize_model(self):
         """Initialize InsightFace model."""
         if not INSIGHTFACE_AVAILABLE:
-            print("[FaceRec] InsightFace not available")
+            log.warning("InsightFace not available")
             return
-        
+
+        # RECOG_MODEL=buffalo_s selects the smaller/faster model pack
+        model_name = os.environ.get("RECOG_MODEL", "buffalo_l")
+        providers = self._select_providers()
+
         try:
             self.model = FaceAnalysis(
-                name="buffalo_l",
-                providers=["CPUExecutionProvider"]
+                name=model_name,
+                providers=providers
             )
             self.model.prepare(ctx_id=0, det_size=(320, 320))
-            print("[FaceRec] Model initialized")
+            log.info("Model initialized (%s, %s)", model_name, providers[0])
         except Exception as e:
-            print(f"[FaceRec] Init failed: {e}")
+            log.error("Init failed: %s", e)
             self.model = None
     
     def load_cache_from_firestore(self):
@@ -59,7 +211,7 @@ class FaceRecognizer:
             from firebase_sync import get_all_people_from_firebase, is_initialized
             
             if not is_initialized():
-                print("[FaceRec] Firebase not initialized, loading from SQLite")
+                log.info("Firebase not initialized, loading from SQLite")
                 self.load_cache_from_database()
                 return
             
@@ -79,12 +231,13 @@ class FaceRecognizer:
                         "context": person_data.get("context", ""),
                         "last_met": person_data.get("last_met", ""),
                     }
-                    self._cache[person_id] = (person, embedding)
-            
-            print(f"[FaceRec] Loaded {len(self._cache)} faces from Firestore")
+                    self._cache[person_id] = (person, self._normalize(embedding))
+
+            self._rebuild_gallery()
+            log.info("Loaded %d faces from Firestore", len(self._cache))
             
         except Exception as e:
-            print(f"[FaceRec] Firestore load error: {e}")
+            log.warning("Firestore load error: %s", e)
             self.load_cache_from_database()
     
     def load_cache_from_database(self):
@@ -97,49 +250,74 @@ class FaceRecognizer:
             
             for person, embedding in known_people:
                 if embedding is not None:
-                    self._cache[person['id']] = (person, embedding)
-            
-            print(f"[FaceRec] Loaded {len(self._cache)} faces from SQLite")
+                    self._cache[person['id']] = (person, self._normalize(embedding))
+
+            self._rebuild_gallery()
+            log.info("Loaded %d faces from SQLite", len(self._cache))
         except Exception as e:
-            print(f"[FaceRec] SQLite load error: {e}")
+            log.warning("SQLite load error: %s", e)
     
     def clear_cache(self):
         """Clear session cache."""
         count = len(self._cache)
         self._cache.clear()
-        print(f"[FaceRec] Cache cleared ({count} entries)")
-    
+        with self._query_cache_lock:
+            self._query_cache.clear()
+        self._rebuild_gallery()
+        log.debug("Cache cleared (%d entries)", count)
+
     def add_to_cache(self, person_id: str, person_data: dict, embedding: np.ndarray):
         """Add newly registered face to cache."""
-        self._cache[person_id] = (person_data, embedding)
-        print(f"[FaceRec] Added to cache: {person_data.get('name')} (total: {len(self._cache)})")
-    
+        self._cache[person_id] = (person_data, self._normalize(embedding))
+        self._rebuild_gallery()
+        log.debug("Added to cache: %s (total: %d)", person_data.get('name'), len(self._cache))
+
     def remove_from_cache(self, person_id: str):
         """Remove from cache."""
         if person_id in self._cache:
             del self._cache[person_id]
+            self._rebuild_gallery()
     
     def update_person_data(self, person_id: str, new_data: dict):
         """Update person info in cache (keeps existing embedding)."""
         if person_id in self._cache:
             _, embedding = self._cache[person_id]
             self._cache[person_id] = (new_data, embedding)
-            print(f"[FaceRec] Updated cache: {new_data.get('name')}")
+            self.cache_version += 1
+            log.debug("Updated cache: %s", new_data.get('name'))
+
+    def get_cached_person(self, person_id: str) -> Optional[dict]:
+        """Person dict from the session cache, or None."""
+        entry = self._cache.get(person_id)
+        return entry[0] if entry else None
     
     def get_cache_count(self) -> int:
         return len(self._cache)
+
+    def warm_up(self):
+        """
+        Trigger the one-time numba compile at startup so the first real
+        frame doesn't pay the multi-second JIT cost.
+        """
+        if NUMBA_AVAILABLE:
+            dummy = np.zeros((1, 512), dtype=np.float32)
+            _argmax_cosine(dummy[0], dummy)
+            log.debug("JIT warm-up complete")
     
-    def decode_image(self, image_base64: str) -> Optional[np.ndarray]:
-        """Decode base64 to OpenCV image."""
+    def decode_image(self, image) -> Optional[np.ndarray]:
+        """
+        Decode a face crop to an OpenCV BGR image.
+        Accepts base64 text or raw encoded bytes (binary WS clients).
+        """
         try:
-            if "," in image_base64:
-                image_base64 = image_base64.split(",")[1]
-            
-            image_bytes = base64.b64decode(image_base64)
-            pil_image = Image.open(BytesIO(image_bytes))
-            return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image_bytes = bytes(image)
+            else:
+                image_bytes = _b64decode(image.split(",", 1)[-1])
+            buf = np.frombuffer(image_bytes, dtype=np.uint8)
+            return cv2.imdecode(buf, cv2.IMREAD_COLOR)
         except Exception as e:
-            print(f"[FaceRec] Decode error: {e}")
+            log.debug("Decode error: %s", e)
             return None
     
     def get_embedding(self, image: np.ndarray) -> Optional[np.ndarray]:
@@ -153,7 +331,7 @@ class FaceRecognizer:
                 return None
             return faces[0].normed_embedding
         except Exception as e:
-            print(f"[FaceRec] Embedding error: {e}")
+            log.debug("Embedding error: %s", e)
             return None
     
     def get_embedding_from_base64(self, image_base64: str) -> Optional[np.ndarray]:
@@ -164,34 +342,206 @@ class FaceRecognizer:
         return self.get_embedding(image)
     
     def compute_similarity(self, emb1: np.ndarray, emb2: np.ndarray) -> float:
-        """Cosine similarity between embeddings."""
-        emb1_norm = emb1 / (np.linalg.norm(emb1) + 1e-8)
-        emb2_norm = emb2 / (np.linalg.norm(emb2) + 1e-8)
-        return float(np.dot(emb1_norm, emb2_norm))
+        """Cosine similarity between unit-length embeddings (raw dot)."""
+        return float(np.dot(emb1, emb2))
     
     def find_match(self, query_embedding: np.ndarray) -> Tuple[Optional[dict], float]:
         """Find best match from cache."""
         if not self._cache:
             return None, 0.0
-        
+
+        # One read of the snapshot; concurrent rebuilds swap in a fresh
+        # tuple without disturbing the one we hold
+        gallery = self._gallery_snapshot()
+
+        # Fastest path: in-process faiss search (SIMD flat scan for small
+        # galleries, sub-linear HNSW once past HNSW_GALLERY_MIN)
+        if gallery is not None and gallery[3] is not None:
+            ids, _, _, index = gallery
+            query = self._normalize(query_embedding)
+            scores, idxs = index.search(query[np.newaxis, :], 1)
+            idx = int(idxs[0, 0])
+            if idx >= 0:
+                best_score = float(scores[0, 0])
+                best_match = None
+                if best_score >= self.SIMILARITY_THRESHOLD:
+                    entry = self._cache.get(ids[idx])
+                    best_match = entry[0] if entry else None
+                return best_match, best_score
+
+        # Fast path: KNN via the sqlite-vec index (C/SIMD scan)
+        try:
+            from database import vec_search
+
+            hit = vec_search(query_embedding)
+            if hit is not None:
+                person_id, distance = hit
+                if distance <= self.DISTANCE_THRESHOLD and person_id in self._cache:
+                    return self._cache[person_id][0], 1.0 - distance
+                return None, 1.0 - distance
+        except Exception as e:
+            log.warning("Vec search error: %s", e)
+
+        # Fallback: score the whole gallery with a single matmul (BLAS GEMV)
+        if gallery is None:
+            return None, 0.0
+        ids, matrix, gallery_int8, _ = gallery
+
+        query = self._normalize(query_embedding)
+
+        if gallery_int8 is not None:
+            q_int8 = self._quantize_int8(query)
+            scores = (gallery_int8 @ q_int8.astype(np.int32)).astype(np.float32)
+            scores *= 1.0 / (127.0 * 127.0)
+            idx = int(scores.argmax())
+            best_score = float(scores[idx])
+        elif NUMBA_AVAILABLE:
+            idx, best_score = _argmax_cosine(query, matrix)
+            idx, best_score = int(idx), float(best_score)
+        else:
+            scores = matrix @ query
+            idx = int(scores.argmax())
+            best_score = float(scores[idx])
+
         best_match = None
-        best_score = -1.0
-        
-        for person_id, (person, embedding) in self._cache.items():
-            score = self.compute_similarity(query_embedding, embedding)
-            if score > best_score:
-                best_score = score
-                if score >= self.SIMILARITY_THRESHOLD:
-                    best_match = person
-        
+        if best_score >= self.SIMILARITY_THRESHOLD:
+            entry = self._cache.get(ids[idx])
+            best_match = entry[0] if entry else None
+
         return best_match, best_score
     
+    @staticmethod
+    def _perceptual_hash(image: np.ndarray) -> bytes:
+        """64-bit average hash: stable across near-duplicate frames."""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+        return np.packbits(small > small.mean()).tobytes()
+
+    def _cached_query_embedding(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """Get an embedding, reusing cached results for near-identical frames."""
+        key = self._perceptual_hash(image)
+        now = time.monotonic()
+
+        with self._query_cache_lock:
+            hit = self._query_cache.get(key)
+            if hit is not None:
+                timestamp, embedding = hit
+                if now - timestamp < self.QUERY_CACHE_TTL:
+                    self._query_cache.move_to_end(key)
+                    return embedding
+                del self._query_cache[key]
+
+        # The ONNX forward runs unlocked; worst case two threads embed
+        # the same frame and the second insert wins
+        embedding = self.get_embedding(image)
+        if embedding is not None:
+            with self._query_cache_lock:
+                self._query_cache[key] = (now, embedding)
+                if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return embedding
+
+    def find_match_batch(self, query_embeddings: list) -> list:
+        """
+        Match several queries at once with a single gallery GEMM.
+        Returns one (person, score) per query.
+        """
+        if not query_embeddings:
+            return []
+        # A single crop per frame is the batcher's common case; send it
+        # through find_match so it keeps the faiss/sqlite-vec index paths
+        if len(query_embeddings) == 1:
+            return [self.find_match(query_embeddings[0])]
+        if not self._cache:
+            return [(None, 0.0)] * len(query_embeddings)
+        gallery = self._gallery_snapshot()
+        if gallery is None:
+            return [(None, 0.0)] * len(query_embeddings)
+        ids, matrix, gallery_int8, index = gallery
+
+        queries = np.stack([self._normalize(q) for q in query_embeddings])
+
+        # Fastest path: one faiss call answers the whole batch
+        if index is not None:
+            scores_k, idxs_k = index.search(queries, 1)
+            results = []
+            for row in range(len(query_embeddings)):
+                idx = int(idxs_k[row, 0])
+                best_score = float(scores_k[row, 0])
+                best_match = None
+                if idx >= 0 and best_score >= self.SIMILARITY_THRESHOLD:
+                    entry = self._cache.get(ids[idx])
+                    best_match = entry[0] if entry else None
+                results.append((best_match, best_score))
+            return results
+
+        if gallery_int8 is not None:
+            # Same int8 path as find_match, batched: int32 accumulation
+            # (512 * 127^2 overflows int16), rescaled back to cosine
+            q_int8 = self._quantize_int8(queries)
+            scores = (gallery_int8 @ q_int8.T.astype(np.int32)).astype(np.float32)
+            scores *= 1.0 / (127.0 * 127.0)
+        elif NUMBA_AVAILABLE:
+            # Same parallel jitted scan as the single-query fallback,
+            # run once per query; warmed up at startup so the first
+            # frame never pays the compile
+            results = []
+            for row in range(queries.shape[0]):
+                idx, best_score = _argmax_cosine(queries[row], matrix)
+                idx, best_score = int(idx), float(best_score)
+                best_match = None
+                if best_score >= self.SIMILARITY_THRESHOLD:
+                    entry = self._cache.get(ids[idx])
+                    best_match = entry[0] if entry else None
+                results.append((best_match, best_score))
+            return results
+        else:
+            scores = matrix @ queries.T  # (gallery, batch)
+
+        results = []
+        for col in range(scores.shape[1]):
+            idx = int(scores[:, col].argmax())
+            best_score = float(scores[idx, col])
+            best_match = None
+            if best_score >= self.SIMILARITY_THRESHOLD:
+                entry = self._cache.get(ids[idx])
+                best_match = entry[0] if entry else None
+            results.append((best_match, best_score))
+        return results
+
+    def recognize_batch(self, images_base64: list) -> list:
+        """
+        Recognize several face crops in one call.
+        Embeds each crop (sharing the query cache), then scores the whole
+        batch against the gallery with one matrix product.
+        Returns one (person, score, embedding) per input.
+        """
+        embeddings = []
+        for image_base64 in images_base64:
+            image = self.decode_image(image_base64)
+            if image is None:
+                embeddings.append(None)
+            else:
+                embeddings.append(self._cached_query_embedding(image))
+
+        results = [(None, 0.0, None)] * len(images_base64)
+        valid = [i for i, emb in enumerate(embeddings) if emb is not None]
+        if valid:
+            matches = self.find_match_batch([embeddings[i] for i in valid])
+            for i, (person, score) in zip(valid, matches):
+                results[i] = (person, score, embeddings[i])
+        return results
+
     def recognize(self, image_base64: str) -> Tuple[Optional[dict], float, Optional[np.ndarray]]:
         """Full recognition pipeline."""
-        embedding = self.get_embedding_from_base64(image_base64)
+        image = self.decode_image(image_base64)
+        if image is None:
+            return None, 0.0, None
+
+        embedding = self._cached_query_embedding(image)
         if embedding is None:
             return None, 0.0, None
-        
+
         person, score = self.find_match(embedding)
         return person, score, embedding
 
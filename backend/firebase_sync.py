@@ -3,21 +3,31 @@ Firebase sync module for RemindAR.
 Handles real-time sync with Firestore including embeddings.
 """
 
+import time
+import logging
 import firebase_admin
 from firebase_admin import credentials, firestore
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Callable, Dict, Any, List
 import numpy as np
 
+log = logging.getLogger(__name__)
+
 # Path to credentials
 CRED_PATH = Path(__file__).parent / "firebase-credentials.json"
 
 # Global state
 _firebase_app: Optional[firebase_admin.App] = None
 _db: Optional[firestore.Client] = None
-_listeners: list[Callable[[str, Dict[str, Any]], None]] = []
 _initialized = False
 
+# Listeners split into a known-good fast path and a quarantine for
+# recently-faulted callbacks, retried after a cooldown
+_listeners_fast: list[Callable[[str, Dict[str, Any]], None]] = []
+_listeners_quarantined: Dict[Callable, float] = {}
+_QUARANTINE_SECONDS = 30.0
+
 
 def init_firebase() -> bool:
     """Initialize Firebase Admin SDK."""
@@ -27,7 +37,7 @@ def init_firebase() -> bool:
         return True
     
     if not CRED_PATH.exists():
-        print("[Firebase] Credentials file not found, running without sync")
+        log.info("Credentials file not found, running without sync")
         return False
     
     try:
@@ -35,10 +45,10 @@ def init_firebase() -> bool:
         _firebase_app = firebase_admin.initialize_app(cred)
         _db = firestore.client()
         _initialized = True
-        print("[Firebase] Initialized successfully")
+        log.info("Initialized successfully")
         return True
     except Exception as e:
-        print(f"[Firebase] Initialization failed: {e}")
+        log.error("Initialization failed: %s", e)
         return False
 
 
@@ -54,16 +64,37 @@ def get_db() -> Optional[firestore.Client]:
 
 def add_update_listener(callback: Callable[[str, Dict[str, Any]], None]):
     """Add a listener for database updates."""
-    _listeners.append(callback)
+    _listeners_fast.append(callback)
 
 
 def notify_update(event_type: str, data: Dict[str, Any]):
     """Notify all listeners of an update."""
-    for listener in _listeners:
+    # Fast path: plain calls, one try around the loop; a fault moves the
+    # offending listener to quarantine and the loop resumes after it
+    i = 0
+    while i < len(_listeners_fast):
+        try:
+            while i < len(_listeners_fast):
+                _listeners_fast[i](event_type, data)
+                i += 1
+        except Exception as e:
+            faulted = _listeners_fast.pop(i)
+            _listeners_quarantined[faulted] = time.monotonic()
+            log.warning("Listener error: %s", e)
+
+    # Slow path: retry quarantined listeners once their cooldown expires
+    now = time.monotonic()
+    for listener, faulted_at in list(_listeners_quarantined.items()):
+        if now - faulted_at < _QUARANTINE_SECONDS:
+            continue
         try:
             listener(event_type, data)
         except Exception as e:
-            print(f"[Firebase] Listener error: {e}")
+            _listeners_quarantined[listener] = now
+            log.warning("Listener error: %s", e)
+        else:
+            del _listeners_quarantined[listener]
+            _listeners_fast.append(listener)
 
 
 def sync_person_to_firebase(person_data: Dict[str, Any], embedding: Optional[np.ndarray] = None):
@@ -95,7 +126,7 @@ def sync_person_to_firebase(person_data: Dict[str, Any], embedding: Optional[np.
         
         # Write to Firestore
         _db.collection("people").document(person_id).set(doc_data, merge=True)
-        print(f"[Firebase] Synced person: {person_id}")
+        log.debug("Synced person: %s", person_id)
         
         # Notify listeners - use serializable data only (no Sentinel!)
         from datetime import datetime
@@ -110,7 +141,60 @@ def sync_person_to_firebase(person_data: Dict[str, Any], embedding: Optional[np.
         notify_update("person_updated", notify_data)
         
     except Exception as e:
-        print(f"[Firebase] Sync error: {e}")
+        log.warning("Sync error: %s", e)
+
+
+# Firestore caps a WriteBatch at 500 operations
+_BATCH_LIMIT = 500
+
+
+def sync_many_to_firebase(items: List[tuple]):
+    """
+    Sync several people with batched writes.
+    items: list of (person_data, embedding-or-None) tuples.
+    Writes are chunked to the 500-operation WriteBatch limit; each
+    chunk commits as one atomic RPC.
+    """
+    if not _initialized or not _db or not items:
+        return
+
+    try:
+        pending = []
+        for person_data, embedding in items:
+            person_id = person_data.get("id")
+            if not person_id:
+                continue
+
+            doc_data = {
+                "name": person_data.get("name", ""),
+                "relation": person_data.get("relation", ""),
+                "last_met": person_data.get("last_met", ""),
+                "context": person_data.get("context", ""),
+                "has_embedding": embedding is not None,
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            }
+            if embedding is not None:
+                doc_data["embedding"] = embedding.tolist()
+
+            pending.append((person_id, doc_data))
+
+        for start in range(0, len(pending), _BATCH_LIMIT):
+            batch = _db.batch()
+            for person_id, doc_data in pending[start:start + _BATCH_LIMIT]:
+                batch.set(
+                    _db.collection("people").document(person_id),
+                    doc_data,
+                    merge=True
+                )
+            batch.commit()
+
+        log.debug("Batch-synced %d people", len(pending))
+
+        for person_id, _ in pending:
+            notify_update("person_updated", {"id": person_id})
+
+    except Exception as e:
+        log.warning("Batch sync error: %s", e)
 
 
 def sync_embedding_to_firebase(person_id: str, embedding: np.ndarray):
@@ -124,7 +208,7 @@ def sync_embedding_to_firebase(person_id: str, embedding: np.ndarray):
             "has_embedding": True,
             "updated_at": firestore.SERVER_TIMESTAMP,
         })
-        print(f"[Firebase] Stored embedding for: {person_id}")
+        log.debug("Stored embedding for: %s", person_id)
         
         notify_update("embedding_added", {
             "id": person_id,
@@ -132,7 +216,7 @@ def sync_embedding_to_firebase(person_id: str, embedding: np.ndarray):
         })
         
     except Exception as e:
-        print(f"[Firebase] Embedding sync error: {e}")
+        log.warning("Embedding sync error: %s", e)
 
 
 def delete_person_from_firebase(person_id: str):
@@ -142,10 +226,10 @@ def delete_person_from_firebase(person_id: str):
     
     try:
         _db.collection("people").document(person_id).delete()
-        print(f"[Firebase] Deleted person: {person_id}")
+        log.debug("Deleted person: %s", person_id)
         notify_update("person_deleted", {"id": person_id})
     except Exception as e:
-        print(f"[Firebase] Delete error: {e}")
+        log.warning("Delete error: %s", e)
 
 
 def get_all_people_from_firebase() -> List[Dict[str, Any]]:
@@ -157,24 +241,34 @@ def get_all_people_from_firebase() -> List[Dict[str, Any]]:
         return []
     
     try:
-        docs = _db.collection("people").where("has_embedding", "==", True).stream()
+        # Project only the fields we use so Firestore sends less data
+        query = (
+            _db.collection("people")
+            .where("has_embedding", "==", True)
+            .select(["name", "relation", "last_met", "context", "embedding"])
+        )
+
         people = []
-        
-        for doc in docs:
+        raw_embeddings = []
+        for doc in query.stream():
             data = doc.to_dict()
             data["id"] = doc.id
-            
-            # Convert embedding list back to numpy array
-            if "embedding" in data and data["embedding"]:
-                data["embedding_array"] = np.array(data["embedding"], dtype=np.float32)
-            else:
-                data["embedding_array"] = None
-                
+            raw_embeddings.append(data.get("embedding"))
             people.append(data)
-        
-        print(f"[Firebase] Loaded {len(people)} people with embeddings")
+
+        # Parse the float lists into arrays in parallel off the load path
+        if people:
+            with ThreadPoolExecutor() as executor:
+                parsed = executor.map(
+                    lambda e: np.asarray(e, dtype=np.float32) if e else None,
+                    raw_embeddings
+                )
+                for data, embedding in zip(people, parsed):
+                    data["embedding_array"] = embedding
+
+        log.info("Loaded %d people with embeddings", len(people))
         return people
-        
+
     except Exception as e:
-        print(f"[Firebase] Fetch error: {e}")
+        log.warning("Fetch error: %s", e)
         return []
@@ -3,86 +3,377 @@ Fast LLM Extraction using Ollama + Phi-3
 Optimized for <2 second response
 """
 
+import asyncio
 import httpx
-import json
+import hashlib
+import logging
 import re
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Optional
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# orjson parses several times faster than stdlib json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Optional sentence encoder for the semantic cache
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_ENCODER_AVAILABLE = True
+except ImportError:
+    SENTENCE_ENCODER_AVAILABLE = False
+
+# Official Ollama client; falls back to the tuned httpx transport below
+try:
+    import ollama
+    OLLAMA_CLIENT_AVAILABLE = True
+except ImportError:
+    OLLAMA_CLIENT_AVAILABLE = False
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+GENERATE_PATH = "/api/generate"
 MODEL = "phi3:mini"  # Smaller, faster model
 
 # Ultra-minimal prompt
 PROMPT = '''JSON only: {{"name":"X","relation":"Y","context":"Z"}}
 Extract from: "{text}"'''
 
+# Bump whenever PROMPT changes so stale cache entries can't leak across
+# prompt revisions
+PROMPT_VERSION = "v1"
 
-@dataclass
+
+# slots=True skips the per-instance __dict__; frozen=True makes
+# instances safely shareable from the extraction cache
+@dataclass(slots=True, frozen=True)
 class ExtractedInfo:
     name: Optional[str] = None
     relation: Optional[str] = None
     context: Optional[str] = None
 
 
+# Sentinel values the model echoes back when a field is missing;
+# frozensets so the per-call membership check is a hashed lookup
+_NULL_NAME = frozenset({None, "null", "", "X"})
+_NULL_RELATION = frozenset({None, "null", "", "Y"})
+_NULL_CONTEXT = frozenset({None, "null", "", "Z"})
+
+
 # Reusable client for connection pooling
 _client: Optional[httpx.AsyncClient] = None
 
+_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=20)
+
+
+def _build_transport() -> httpx.AsyncHTTPTransport:
+    """Transport with retries; HTTP/2 multiplexing when h2 is installed."""
+    try:
+        return httpx.AsyncHTTPTransport(retries=1, http2=True, limits=_LIMITS)
+    except ImportError:
+        return httpx.AsyncHTTPTransport(retries=1, limits=_LIMITS)
+
+
 async def get_client() -> httpx.AsyncClient:
     global _client
     if _client is None:
-        _client = httpx.AsyncClient(timeout=30.0)
+        _client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            timeout=httpx.Timeout(30.0, connect=2.0),
+            transport=_build_transport(),
+        )
     return _client
 
 
+async def close_client():
+    """Close the shared client (call on server shutdown)."""
+    global _client, _ollama_client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _ollama_client = None
+
+
+_ollama_client: Optional["ollama.AsyncClient"] = None
+
+# Generation knobs shared by both client paths
+_GEN_OPTIONS = {
+    "temperature": 0,
+    "num_predict": 50,  # Very short
+    "top_k": 1,
+}
+
+
+async def _generate(prompt: str) -> Optional[str]:
+    """
+    Run one generation against Ollama, returning the raw model output.
+    Uses the official ollama client when installed (it handles pooling
+    and response decoding natively); otherwise POSTs via httpx.
+    Returns None on a non-200 response.
+    """
+    global _ollama_client
+    if OLLAMA_CLIENT_AVAILABLE:
+        if _ollama_client is None:
+            _ollama_client = ollama.AsyncClient(host=OLLAMA_BASE_URL)
+        resp = await _ollama_client.generate(
+            model=MODEL,
+            prompt=prompt,
+            stream=False,
+            format="json",
+            options=_GEN_OPTIONS,
+            keep_alive="5m",
+        )
+        return resp["response"]
+
+    client = await get_client()
+    response = await client.post(
+        GENERATE_PATH,
+        json={
+            "model": MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "format": "json",
+            "options": _GEN_OPTIONS,
+            "keep_alive": "5m",  # Keep the model resident between calls
+        }
+    )
+    if response.status_code != 200:
+        log.warning("Ollama error: %s", response.status_code)
+        return None
+    return json_loads(response.content).get("response", "")
+
+
+# Content-addressable extraction cache: temperature=0 makes results
+# deterministic, so repeated (or re-cased/re-spaced) sentences skip the
+# LLM entirely. Keyed by model + prompt version + sentence hash so a
+# model swap or prompt edit never serves stale extractions.
+_CACHE_SIZE = 1024
+_extract_cache: "OrderedDict[str, ExtractedInfo]" = OrderedDict()
+
+
+def _cache_key(sentence: str) -> str:
+    normalized = " ".join(sentence.strip().lower().split())
+    payload = f"{MODEL}|{PROMPT_VERSION}|{normalized}".encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _cache_put(key: str, info: ExtractedInfo):
+    _extract_cache[key] = info
+    if len(_extract_cache) > _CACHE_SIZE:
+        _extract_cache.popitem(last=False)
+
+
+# Semantic cache: paraphrases ("He's my brother John" / "John is my
+# brother") miss the exact-match cache but want the same extraction.
+# When sentence-transformers is installed, each sentence is embedded
+# with MiniLM and any cached neighbour above the cosine threshold is
+# reused instead of calling the LLM.
+_SEM_THRESHOLD = 0.92
+_SEM_CACHE_SIZE = 2048
+_sem_encoder = None
+_sem_encoder_lock = threading.Lock()
+_sem_vectors: Optional[np.ndarray] = None  # (N, 384) L2-normalized
+_sem_values: list = []
+
+
+def _get_encoder():
+    global _sem_encoder
+    if _sem_encoder is None and SENTENCE_ENCODER_AVAILABLE:
+        # Loaded from worker threads, so guard against a double load
+        with _sem_encoder_lock:
+            if _sem_encoder is None:
+                try:
+                    _sem_encoder = SentenceTransformer("all-MiniLM-L6-v2")
+                except Exception as e:
+                    log.warning("Sentence encoder unavailable: %s", e)
+    return _sem_encoder
+
+
+def _sem_embed(sentence: str) -> Optional[np.ndarray]:
+    encoder = _get_encoder()
+    if encoder is None:
+        return None
+    vec = encoder.encode(sentence.strip(), convert_to_numpy=True)
+    vec = vec.astype(np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else None
+
+
+def _sem_lookup(vec: np.ndarray) -> Optional[ExtractedInfo]:
+    if _sem_vectors is None or len(_sem_values) == 0:
+        return None
+    sims = _sem_vectors @ vec
+    best = int(np.argmax(sims))
+    if sims[best] >= _SEM_THRESHOLD:
+        return _sem_values[best]
+    return None
+
+
+def _sem_put(vec: np.ndarray, info: ExtractedInfo):
+    global _sem_vectors
+    if _sem_vectors is None:
+        _sem_vectors = vec[np.newaxis, :]
+        _sem_values.append(info)
+        return
+    _sem_vectors = np.vstack([_sem_vectors, vec])
+    _sem_values.append(info)
+    if len(_sem_values) > _SEM_CACHE_SIZE:
+        # Drop the oldest entry; a flat matrix makes true LRU costly
+        _sem_vectors = _sem_vectors[1:]
+        _sem_values.pop(0)
+
+
+def invalidate_cache():
+    """Drop all cached extractions."""
+    global _sem_vectors
+    _extract_cache.clear()
+    _sem_vectors = None
+    _sem_values.clear()
+
+
+# Compiled once: some models wrap the object in markdown fences even
+# with format=json set
+_FENCE_JSON = re.compile(r'```json\s*', re.IGNORECASE)
+_FENCE = re.compile(r'```\s*')
+
+
+def _find_json(text: str) -> Optional[str]:
+    """
+    One-pass scan for the first balanced {...} substring.
+    Tracks string/escape state so braces inside values don't confuse
+    the depth count; handles nested objects, which the old
+    find/rfind slice did not when trailing text contained a brace.
+    """
+    start = -1
+    depth = 0
+    in_string = False
+    escape = False
+
+    for i, ch in enumerate(text):
+        if escape:
+            escape = False
+            continue
+        if ch == "\\":
+            escape = in_string
+            continue
+        if ch == '"':
+            in_string = not in_string
+            continue
+        if in_string:
+            continue
+        if ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}":
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+    return None
+
+
+def parse_llm_output(raw: str) -> Optional[dict]:
+    """
+    Pull the JSON object out of a model response.
+    Strips markdown fences and stray text around the braces.
+    Returns None when no parseable object is found.
+    """
+    if not raw:
+        return None
+
+    text = _FENCE_JSON.sub('', raw)
+    text = _FENCE.sub('', text)
+
+    candidate = _find_json(text)
+    if candidate is None:
+        return None
+
+    try:
+        return json_loads(candidate)
+    except ValueError:
+        return None
+
+
+# Malformed-JSON retries; the vast majority of calls succeed first try
+_MAX_ATTEMPTS = 3
+
+
 async def extract_info_async(sentence: str) -> ExtractedInfo:
     """Fast extraction - target <2s response."""
     if not sentence or len(sentence.strip()) < 3:
         return ExtractedInfo()
-    
+
+    cache_key = _cache_key(sentence)
+    cached = _extract_cache.get(cache_key)
+    if cached is not None:
+        _extract_cache.move_to_end(cache_key)
+        return cached
+
+    # Exact miss: try a semantic neighbour before paying for the LLM.
+    # Encoding (and the first-call model load) is CPU-bound, so it runs
+    # off the event loop like the rest of the heavy work
+    sem_vec = None
+    if SENTENCE_ENCODER_AVAILABLE:
+        sem_vec = await asyncio.to_thread(_sem_embed, sentence)
+    if sem_vec is not None:
+        cached = _sem_lookup(sem_vec)
+        if cached is not None:
+            return cached
+
     prompt = PROMPT.format(text=sentence.strip())
-    
+
     try:
-        client = await get_client()
-        response = await client.post(
-            OLLAMA_URL,
-            json={
-                "model": MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "format": "json",
-                "options": {
-                    "temperature": 0,
-                    "num_predict": 50,  # Very short
-                    "top_k": 1,
-                }
-            }
-        )
-        
-        if response.status_code != 200:
-            print(f"[LLM] Error: {response.status_code}")
-            return ExtractedInfo()
-        
-        raw = response.json().get("response", "")
-        print(f"[LLM] {raw}")
-        
-        # Parse JSON
-        match = re.search(r'\{[^{}]*\}', raw)
-        if not match:
+        # Retry with the bad output quoted back: at temperature 0 a
+        # straight resend would fail identically, but telling the model
+        # its previous output was invalid usually fixes it
+        data = None
+        attempt_prompt = prompt
+        for attempt in range(_MAX_ATTEMPTS):
+            raw = await _generate(attempt_prompt)
+            if raw is None:
+                return ExtractedInfo()
+            log.debug("Raw output: %s", raw)
+
+            data = parse_llm_output(raw)
+            if data is not None:
+                break
+
+            if attempt + 1 < _MAX_ATTEMPTS:
+                log.debug("Invalid JSON on attempt %d, retrying", attempt + 1)
+                attempt_prompt = (
+                    f"{prompt}\n\nPrevious output was invalid JSON: "
+                    f"{raw[:200]!r}. Return ONLY valid JSON matching the schema."
+                )
+                await asyncio.sleep(1.0 * (attempt + 1))
+
+        if data is None:
             return ExtractedInfo()
         
-        data = json.loads(match.group(0))
-        
         name = data.get("name")
         relation = data.get("relation")
         context = data.get("context")
         
         # Clean null/empty
-        if name in [None, "null", "", "X"]: name = None
-        if relation in [None, "null", "", "Y"]: relation = None
-        if context in [None, "null", "", "Z"]: context = None
-        
-        return ExtractedInfo(name=name, relation=relation, context=context)
+        if name in _NULL_NAME: name = None
+        if relation in _NULL_RELATION: relation = None
+        if context in _NULL_CONTEXT: context = None
         
+        info = ExtractedInfo(name=name, relation=relation, context=context)
+        # Only cache extractions that actually found something; all-null
+        # results are cheap to retry and may improve with rephrasing
+        if name or relation or context:
+            _cache_put(cache_key, info)
+            if sem_vec is not None:
+                _sem_put(sem_vec, info)
+        return info
+
     except Exception as e:
-        print(f"[LLM] Error: {e}")
+        log.warning("Extraction error: %s", e)
         return ExtractedInfo()
@@ -8,21 +8,83 @@ Handles:
 - Identity + memory context responses
 """
 
+import os
 import json
 import asyncio
+import logging
 from typing import Dict, Set
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+log = logging.getLogger(__name__)
+
+# orjson serializes several times faster than stdlib json; the WS loop
+# emits base64-laden frames at video rate, so it matters (inbound
+# parsing goes through msgspec or the pydantic adapter instead)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+
+    def _json_dumps(data) -> str:
+        return orjson.dumps(data).decode()
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+    def _json_dumps(data) -> str:
+        return json.dumps(data)
+
+# Optional MessagePack support: binary frames skip base64 inflation and
+# UTF-8 validation entirely for clients that opt in by sending binary
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Optional msgspec: text frames decode straight into tagged structs,
+# skipping the per-frame dict allocation of json.loads
+try:
+    import msgspec
+    from typing import Annotated, List, Union
+
+    class _FaceCrop(msgspec.Struct, gc=False):
+        track_id: str = "unknown"
+        # Same cap as models.FaceData; msgspec enforces it in C during
+        # decode, so oversize payloads never reach base64 decoding
+        image_base64: Annotated[str, msgspec.Meta(max_length=200_000)] = ""
+
+    class _FaceDataMsg(msgspec.Struct, tag="face_data", tag_field="type"):
+        data: _FaceCrop
+
+    class _FaceBatchBody(msgspec.Struct, gc=False):
+        faces: List[_FaceCrop] = msgspec.field(default_factory=list)
+
+    class _FaceDataBatchMsg(msgspec.Struct, tag="face_data_batch", tag_field="type"):
+        data: _FaceBatchBody
+
+    class _PingMsg(msgspec.Struct, tag="ping", tag_field="type"):
+        pass
+
+    _WS_DECODER = msgspec.json.Decoder(
+        Union[_FaceDataMsg, _FaceDataBatchMsg, _PingMsg]
+    )
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from pydantic import ValidationError
 
 from models import (
-    Person, 
-    PersonCreate, 
-    FaceData, 
+    Person,
+    PersonCreate,
+    FaceData,
     RecognitionResult,
-    WebSocketMessage
+    INBOUND_ADAPTER
 )
 from database import (
     init_database, 
@@ -54,19 +116,28 @@ async def lifespan(app: FastAPI):
     Application startup and shutdown handler.
     Flow: Firestore → SQLite → In-Memory Cache
     """
-    print("[Server] Starting RemindAR backend...")
-    
+    log.info("Starting RemindAR backend...")
+
+    # Size the default executor to the CPU count so offloaded recognition
+    # work (decode + ONNX) scales with cores instead of the tiny default
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=os.cpu_count()))
+
+    # Firestore listener callbacks arrive on background threads; they
+    # need the server loop to schedule broadcasts onto
+    app.state.main_loop = loop
+
     # Initialize database
     init_database()
     
     # Initialize Firebase
-    print("[Server] Initializing Firebase...")
+    log.info("Initializing Firebase...")
     firebase_ok = init_firebase()
     if firebase_ok:
         add_update_listener(broadcast_update)
         
         # Sync Firestore → SQLite
-        print("[Server] Syncing Firestore → SQLite...")
+        log.info("Syncing Firestore → SQLite...")
         from firebase_sync import get_all_people_from_firebase
         from database import sync_from_firestore
         
@@ -74,26 +145,44 @@ async def lifespan(app: FastAPI):
         if firestore_people:
             sync_from_firestore(firestore_people)
         else:
-            print("[Server] No data in Firestore, checking SQLite...")
+            log.info("No data in Firestore, checking SQLite...")
+            # Converge the other way: push local people up in chunked
+            # WriteBatch RPCs instead of one set() call per person
+            from database import get_all_people_with_embeddings
+            from firebase_sync import sync_many_to_firebase
+
+            local_people = get_all_people_with_embeddings()
+            if local_people:
+                log.info("Syncing %d people SQLite → Firestore...", len(local_people))
+                await asyncio.to_thread(sync_many_to_firebase, local_people)
     
     # Check if we have data
     people = get_all_people()
-    print(f"[Server] SQLite has {len(people)} people")
+    log.info("SQLite has %d people", len(people))
     
     # Initialize face recognizer
-    print("[Server] Initializing face recognition model...")
+    log.info("Initializing face recognition model...")
     recognizer = get_recognizer()
     
     # Load cache from SQLite (fastest)
-    print("[Server] Loading cache from SQLite...")
+    log.info("Loading cache from SQLite...")
     recognizer.load_cache_from_database()
-    
-    print("[Server] Backend ready!")
-    
+
+    # Compile the jitted gallery scan now rather than on the first frame
+    await asyncio.to_thread(recognizer.warm_up)
+
+    # Start coalescing recognition requests across clients
+    face_batcher.start()
+
+    log.info("Backend ready!")
+
     yield
-    
+
     # Cleanup
-    print("[Server] Shutting down...")
+    log.info("Shutting down...")
+    await face_batcher.stop()
+    from llm_extraction import close_client
+    await close_client()
     recognizer.clear_cache()
 
 
@@ -106,7 +195,9 @@ app = FastAPI(
     title="RemindAR API",
     description="AI-powered AR memory assistant backend",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson serializes /people-style payloads ~3x faster than stdlib
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
 )
 
 # CORS middleware for frontend communication
@@ -131,21 +222,28 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: Set[WebSocket] = set()
-    
+        # Clients that sent a binary frame get MessagePack replies
+        self.binary_clients: Set[WebSocket] = set()
+
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.add(websocket)
-        print(f"[WS] Client connected. Total: {len(self.active_connections)}")
-    
+        log.debug("Client connected. Total: %d", len(self.active_connections))
+
     def disconnect(self, websocket: WebSocket):
         self.active_connections.discard(websocket)
-        print(f"[WS] Client disconnected. Total: {len(self.active_connections)}")
-    
+        self.binary_clients.discard(websocket)
+        log.debug("Client disconnected. Total: %d", len(self.active_connections))
+
     async def send_json(self, websocket: WebSocket, data: dict):
         try:
-            await websocket.send_json(data)
+            if websocket in self.binary_clients:
+                await websocket.send_bytes(msgpack.packb(data))
+            else:
+                # Text frame for browser clients, serialized with orjson
+                await websocket.send_text(_json_dumps(data))
         except Exception as e:
-            print(f"[WS] Send error: {e}")
+            log.debug("Send error: %s", e)
 
 
 manager = ConnectionManager()
@@ -153,33 +251,117 @@ manager = ConnectionManager()
 
 # Broadcast function for Firebase sync updates
 def broadcast_update(event_type: str, data: dict):
-    """Broadcast an update to all connected WebSocket clients."""
+    """
+    Broadcast an update to all connected WebSocket clients.
+    Runs on Firestore listener threads, so the coroutine is handed to
+    the server loop captured at startup; get_event_loop() from a
+    foreign thread either raised or targeted the wrong loop.
+    """
     message = {
         "type": "sync_update",
         "event": event_type,
         "data": data
     }
-    
-    # Run async broadcast in event loop
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            asyncio.create_task(broadcast_to_all(message))
-        else:
-            loop.run_until_complete(broadcast_to_all(message))
-    except RuntimeError:
-        # No event loop, skip broadcast
-        pass
+
+    loop = getattr(app.state, "main_loop", None)
+    if loop is None or loop.is_closed():
+        # Server not up (or already down); nothing to broadcast to
+        return
+    asyncio.run_coroutine_threadsafe(broadcast_to_all(message), loop)
 
 
 async def broadcast_to_all(message: dict):
-    """Send message to all connected clients."""
-    for ws in list(manager.active_connections):
-        try:
-            await ws.send_json(message)
-        except Exception as e:
-            print(f"[WS] Broadcast error: {e}")
+    """
+    Send message to all connected clients concurrently.
+    One slow peer no longer stalls delivery to everyone behind it.
+    """
+    payload = _json_dumps(message)
+    packed = msgpack.packb(message) if manager.binary_clients else None
+
+    connections = list(manager.active_connections)
+    results = await asyncio.gather(
+        *(
+            ws.send_bytes(packed) if ws in manager.binary_clients
+            else ws.send_text(payload)
+            for ws in connections
+        ),
+        return_exceptions=True,
+    )
+    for ws, result in zip(connections, results):
+        if isinstance(result, BaseException):
+            log.debug("Broadcast error: %s", result)
             manager.active_connections.discard(ws)
+            manager.binary_clients.discard(ws)
+
+
+# ============================================================================
+# Face Recognition Micro-Batcher
+# ============================================================================
+
+class FaceBatcher:
+    """
+    Coalesces face_data frames from all connected clients into
+    micro-batches. Frames arriving within a short window are embedded
+    together and matched with a single gallery GEMM, amortizing the
+    per-forward overhead across clients.
+    """
+
+    WINDOW = 0.015   # seconds to wait for more frames
+    MAX_BATCH = 16
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def recognize(self, image_base64: str):
+        """Queue a frame and await its (person, confidence, embedding)."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_base64, future))
+        return await future
+
+    async def _run(self):
+        recognizer = get_recognizer()
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Block for the first frame, then coalesce briefly
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.WINDOW
+            while len(items) < self.MAX_BATCH and loop.time() < deadline:
+                try:
+                    items.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.001)
+
+            try:
+                results = await asyncio.to_thread(
+                    recognizer.recognize_batch, [img for img, _ in items]
+                )
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+face_batcher = FaceBatcher()
 
 
 # ============================================================================
@@ -227,10 +409,48 @@ def build_recognition_result(
     return result.model_dump()
 
 
+@lru_cache(maxsize=256)
+def _cached_result_payload(track_id: str, person_id: str | None,
+                           conf_bucket: int, cache_version: int) -> str:
+    """
+    Serialized recognition_result text frame. The same person tracked
+    across frames re-emits an identical payload, so confidence is
+    quantized to 0.05 buckets and the JSON is built once per
+    (track, person, bucket). cache_version keys out stale person data.
+    """
+    recognizer = get_recognizer()
+    person = recognizer.get_cached_person(person_id) if person_id else None
+    result = build_recognition_result(track_id, person, conf_bucket * 0.05)
+    return _json_dumps({"type": "recognition_result", "data": result})
+
+
 # ============================================================================
 # WebSocket Endpoint
 # ============================================================================
 
+# Same 200 KB image cap the msgspec/pydantic decoders enforce on text
+# frames; binary MessagePack frames skip those validators, so the bound
+# is applied here before any decode work
+_MAX_IMAGE_PAYLOAD = 200_000
+
+
+def _extract_ws_crops(msg_type, data) -> list:
+    """Pull (track_id, image) pairs out of a dict-decoded message."""
+    if msg_type == "face_data":
+        # Binary clients send raw JPEG bytes, text clients send base64
+        image = data.get("image_bytes") or data.get("image_base64", "")
+        if len(image) > _MAX_IMAGE_PAYLOAD:
+            return []
+        return [(data.get("track_id", "unknown"), image)]
+    if msg_type == "face_data_batch":
+        return [
+            (face.get("track_id", "unknown"), face.get("image_base64", ""))
+            for face in data.get("faces", [])
+            if len(face.get("image_base64", "")) <= _MAX_IMAGE_PAYLOAD
+        ]
+    return []
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -245,44 +465,109 @@ async def websocket_endpoint(websocket: WebSocket):
     
     try:
         while True:
-            # Receive message
-            raw_message = await websocket.receive_text()
-            
-            try:
-                message = json.loads(raw_message)
-            except json.JSONDecodeError:
-                continue
-            
-            msg_type = message.get("type")
-            data = message.get("data", {})
-            
+            # Receive either a text-JSON or binary-MessagePack frame
+            raw_message = await websocket.receive()
+            if raw_message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw_message.get("code", 1000))
+
+            # Normalize every frame to (msg_type, crops) where crops is a
+            # list of (track_id, image) pairs, whatever the wire format
+            if raw_message.get("bytes") is not None:
+                if not MSGPACK_AVAILABLE:
+                    continue
+                manager.binary_clients.add(websocket)
+                try:
+                    message = msgpack.unpackb(raw_message["bytes"], raw=False)
+                except Exception:
+                    continue
+                msg_type = message.get("type")
+                crops = _extract_ws_crops(msg_type, message.get("data", {}))
+            elif MSGSPEC_AVAILABLE:
+                # Tagged-union decode: no intermediate dict per frame
+                try:
+                    msg = _WS_DECODER.decode(raw_message.get("text") or "")
+                except msgspec.DecodeError:
+                    continue
+                if isinstance(msg, _PingMsg):
+                    msg_type, crops = "ping", []
+                elif isinstance(msg, _FaceDataMsg):
+                    msg_type = "face_data"
+                    crops = [(msg.data.track_id, msg.data.image_base64)]
+                else:
+                    msg_type = "face_data_batch"
+                    crops = [(f.track_id, f.image_base64) for f in msg.data.faces]
+            else:
+                # Pydantic fallback: the discriminated union dispatches
+                # on "type" inside pydantic-core, no intermediate dict
+                try:
+                    msg = INBOUND_ADAPTER.validate_json(raw_message.get("text") or "")
+                except ValidationError:
+                    continue
+                msg_type = msg.type
+                if msg_type == "face_data":
+                    crops = [(msg.data.track_id, msg.data.image_base64)]
+                elif msg_type == "face_data_batch":
+                    crops = [(f.track_id, f.image_base64) for f in msg.data.faces]
+                else:
+                    crops = []
+
             # Handle different message types
             if msg_type == "ping":
                 await manager.send_json(websocket, {"type": "pong"})
-                
+
             elif msg_type == "face_data":
-                # Process face recognition
-                track_id = data.get("track_id", "unknown")
-                image_base64 = data.get("image_base64", "")
-                
-                if not image_base64:
+                track_id, image = crops[0]
+                if not image:
+                    continue
+
+                # Recognition runs in the shared micro-batcher, which
+                # coalesces frames from all clients off the event loop
+                person, confidence, embedding = await face_batcher.recognize(image)
+
+                if websocket not in manager.binary_clients:
+                    # Text clients get the memoized payload: a tracked
+                    # person re-emits the same JSON frame after frame
+                    payload = _cached_result_payload(
+                        track_id,
+                        person["id"] if person else None,
+                        round(confidence / 0.05),
+                        recognizer.cache_version,
+                    )
+                    try:
+                        await websocket.send_text(payload)
+                    except Exception as e:
+                        log.debug("Send error: %s", e)
+                else:
+                    result = build_recognition_result(track_id, person, confidence)
+                    await manager.send_json(websocket, {
+                        "type": "recognition_result",
+                        "data": result
+                    })
+
+            elif msg_type == "face_data_batch":
+                # Multiple crops in one frame: embed together, match with one GEMM
+                if not crops:
                     continue
-                
-                # Run recognition
-                person, confidence, embedding = recognizer.recognize(image_base64)
-                
-                # Build and send result
-                result = build_recognition_result(track_id, person, confidence)
-                
+
+                batch_results = await asyncio.to_thread(
+                    recognizer.recognize_batch,
+                    [image for _, image in crops]
+                )
+
+                results = [
+                    build_recognition_result(track_id, person, confidence)
+                    for (track_id, _), (person, confidence, _) in zip(crops, batch_results)
+                ]
+
                 await manager.send_json(websocket, {
-                    "type": "recognition_result",
-                    "data": result
+                    "type": "recognition_result_batch",
+                    "data": {"results": results}
                 })
-                
+
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        print(f"[WS] Error: {e}")
+        log.warning("WebSocket error: %s", e)
         manager.disconnect(websocket)
 
 
@@ -335,25 +620,58 @@ async def transcribe_audio(audio_data: bytes = None):
 
 from fastapi import File, UploadFile
 
+# Uploads up to this size are transcribed straight from memory; larger
+# ones spool to a temp file instead
+_MAX_AUDIO_IN_MEMORY = 16 * 1024 * 1024
+
 @app.post("/api/transcribe")
 async def api_transcribe(audio: UploadFile = File(...)):
     """
     Transcribe uploaded audio file to text.
     Accepts WAV, MP3, or WebM audio.
     """
-    from speech_to_text import get_stt
-    
+    from speech_to_text import get_stt, WHISPER_AVAILABLE, _tmpfs_dir
+
+    import shutil
+    import tempfile
+
     stt = get_stt()
-    
-    if stt.model is None:
+
+    # The model itself loads lazily on first use; only bail out when
+    # faster-whisper isn't installed at all
+    if not WHISPER_AVAILABLE:
         return {"error": "STT model not loaded", "text": ""}
-    
-    # Read audio data
-    audio_bytes = await audio.read()
-    
-    # Transcribe
-    text = stt.transcribe(audio_bytes)
-    
+
+    # Typical voice clips fit in memory: a bounded read feeds
+    # transcribe_async, which decodes in-process via soundfile and only
+    # falls back to a temp file for formats it can't parse
+    head = await audio.read(_MAX_AUDIO_IN_MEMORY + 1)
+    if len(head) <= _MAX_AUDIO_IN_MEMORY:
+        text = await stt.transcribe_async(head)
+        return {
+            "text": text or "",
+            "success": text is not None
+        }
+
+    # Oversized upload: spool the bytes already read plus the remainder
+    # to a temp file (tmpfs when available, so the spool stays in RAM)
+    # in a worker thread instead of buffering it all on the event loop
+    loop = asyncio.get_running_loop()
+    with tempfile.NamedTemporaryFile(
+        suffix=".wav", dir=_tmpfs_dir(), delete=False
+    ) as tmp:
+        await loop.run_in_executor(None, tmp.write, head)
+        await loop.run_in_executor(None, shutil.copyfileobj, audio.file, tmp)
+        temp_path = tmp.name
+
+    try:
+        text = await loop.run_in_executor(None, stt.transcribe_file, temp_path)
+    finally:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
     return {
         "text": text or "",
         "success": text is not None
@@ -384,6 +702,35 @@ async def api_extract(request: ExtractionRequest):
 
 
 
+class BatchExtractionRequest(BaseModel):
+    sentences: list[str]
+
+@app.post("/api/extract-batch")
+async def api_extract_batch(request: BatchExtractionRequest):
+    """
+    Extract structured info from several sentences concurrently.
+    Ollama requests overlap; set OLLAMA_NUM_PARALLEL>1 to run them truly
+    in parallel on the model side.
+    """
+    from llm_extraction import extract_info_async
+
+    results = await asyncio.gather(
+        *(extract_info_async(sentence) for sentence in request.sentences)
+    )
+
+    return {
+        "results": [
+            {
+                "name": result.name,
+                "relation": result.relation,
+                "context": result.context,
+                "success": any([result.name, result.relation, result.context])
+            }
+            for result in results
+        ]
+    }
+
+
 @app.get("/people", response_model=list[Person])
 async def list_people():
     """Get all known people."""
@@ -418,14 +765,20 @@ async def create_person(person: PersonCreate):
     
     if not success:
         raise HTTPException(status_code=400, detail="Failed to create person")
-    
-    # Get the created person
-    created_person = get_person(person_id)
-    
+
+    # We already have everything the row contains; skip the read-back
+    created_person = {
+        "id": person_id,
+        "name": person.name,
+        "relation": person.relation,
+        "last_met": person.last_met,
+        "context": person.context,
+    }
+
     # Sync to Firebase and broadcast to all clients
     sync_person_to_firebase(created_person)
     
-    print(f"[API] Created person: {person.name} ({person_id})")
+    log.debug("Created person: %s (%s)", person.name, person_id)
     return created_person
 
 
@@ -464,7 +817,7 @@ async def update_person(person_id: str, person: PersonCreate):
         "data": updated_person
     })
     
-    print(f"[API] Updated person: {person.name} ({person_id})")
+    log.debug("Updated person: %s (%s)", person.name, person_id)
     return updated_person
 
 
@@ -480,7 +833,9 @@ async def register_face(person_id: str, face_data: FaceData):
         raise HTTPException(status_code=404, detail="Person not found")
     
     recognizer = get_recognizer()
-    embedding = recognizer.get_embedding_from_base64(face_data.image_base64)
+    embedding = await asyncio.to_thread(
+        recognizer.get_embedding_from_base64, face_data.image_base64
+    )
     
     if embedding is None:
         raise HTTPException(status_code=400, detail="Could not extract face embedding")
@@ -489,22 +844,22 @@ async def register_face(person_id: str, face_data: FaceData):
     success = update_embedding(person_id, embedding)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to update embedding")
-    
-    # Add to local cache immediately
-    updated_person = get_person(person_id)
-    recognizer.add_to_cache(person_id, updated_person, embedding)
-    
+
+    # Add to local cache immediately; the row's person fields haven't
+    # changed, so reuse the dict we already fetched
+    recognizer.add_to_cache(person_id, person, embedding)
+
     # Store embedding in Firestore for persistence
     sync_embedding_to_firebase(person_id, embedding)
-    
+
     # Broadcast for real-time update
     await broadcast_to_all({
         "type": "person_registered",
-        "data": updated_person
+        "data": person
     })
-    
-    print(f"[API] Registered face for: {person.get('name')} ({person_id})")
-    return {"status": "success", "person_id": person_id, "person": updated_person}
+
+    log.debug("Registered face for: %s (%s)", person.get('name'), person_id)
+    return {"status": "success", "person_id": person_id, "person": person}
 
 
 @app.delete("/people/{person_id}")
@@ -527,7 +882,7 @@ async def remove_person(person_id: str):
         "data": {"id": person_id}
     })
     
-    print(f"[API] Deleted person: {person_id}")
+    log.debug("Deleted person: %s", person_id)
     return {"status": "deleted", "person_id": person_id}
 
 
@@ -542,5 +897,8 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
+        loop="uvloop",      # 2-4x faster event loop for the WS hot path
+        http="httptools",
+        ws="websockets",
         log_level="info"
     )
@@ -3,8 +3,8 @@ Pydantic models for RemindAR backend.
 Defines data structures for API communication.
 """
 
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import Annotated, Literal, Optional, List, Union
 from datetime import datetime
 
 
@@ -18,9 +18,8 @@ class Person(BaseModel):
     relation: str
     last_met: str
     context: str
-    
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PersonCreate(BaseModel):
@@ -31,30 +30,58 @@ class PersonCreate(BaseModel):
     context: str
 
 
+class BBox(BaseModel):
+    """
+    Face bounding box in normalized coordinates (0-1).
+    Field names mirror the frontend's BoundingBox interface.
+    """
+    x: float
+    y: float
+    width: float
+    height: float
+
+
 class FaceData(BaseModel):
     """
     Incoming face crop data from frontend.
     Contains base64-encoded image and tracking ID.
     """
+    # Frozen skips mutation bookkeeping and extra="forbid" skips the
+    # __pydantic_extra__ hashmap — this model is built at video rate
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     # Unique tracking ID for this face in the current session
     # Helps correlate faces across frames
     track_id: str
-    
-    # Base64-encoded JPEG image of the cropped face
-    image_base64: str
-    
+
+    # Base64-encoded JPEG image of the cropped face; the length cap
+    # (~150 KB raw JPEG) rejects oversize/garbage payloads in
+    # pydantic-core before any decode work
+    image_base64: str = Field(max_length=200_000)
+
     # Bounding box in normalized coordinates (0-1)
-    bbox: Optional[dict] = None
-    
+    bbox: Optional[BBox] = None
+
     # Timestamp for latency tracking
     timestamp: Optional[float] = None
 
+    @field_validator("image_base64")
+    @classmethod
+    def _check_base64_shape(cls, v: str) -> str:
+        # Valid base64 is always a multiple of 4 chars; check the part
+        # after any data-URL prefix so bad frames fail here, cheaply
+        if len(v.rsplit(",", 1)[-1]) % 4 != 0:
+            raise ValueError("image_base64 length must be a multiple of 4")
+        return v
+
 
 class RecognitionResult(BaseModel):
     """
     Outgoing identity response to frontend.
     Contains matched person info or unknown indicator.
     """
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     # Same track_id as input for correlation
     track_id: str
     
@@ -77,5 +104,48 @@ class WebSocketMessage(BaseModel):
     Generic WebSocket message wrapper.
     Supports different message types for extensibility.
     """
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     type: str  # "face_data", "recognition_result", "ping", "pong"
     data: Optional[dict] = None
+
+
+class PingMessage(BaseModel):
+    """Inbound keep-alive frame."""
+    type: Literal["ping"]
+
+
+class FaceDataMessage(BaseModel):
+    """Inbound frame carrying a single face crop."""
+    type: Literal["face_data"]
+    data: FaceData
+
+
+class FaceBatch(BaseModel):
+    """Payload of a face_data_batch frame."""
+    faces: List[FaceData] = []
+
+
+class FaceDataBatchMessage(BaseModel):
+    """Inbound frame carrying several crops from one video frame."""
+    type: Literal["face_data_batch"]
+    data: FaceBatch
+
+
+# Tagged union over inbound frames: pydantic-core dispatches on "type"
+# in Rust and parses straight into the right model, instead of a generic
+# wrapper parse followed by a second validation of its data dict
+InboundMessage = Annotated[
+    Union[FaceDataMessage, FaceDataBatchMessage, PingMessage],
+    Field(discriminator="type"),
+]
+
+# Built once at import; validate_json goes bytes -> model without a
+# Python-level json.loads in between
+INBOUND_ADAPTER = TypeAdapter(InboundMessage)
+
+# Shared adapters for callers validating these models outside FastAPI's
+# request machinery; constructing a TypeAdapter per call re-resolves
+# the validator core every time
+WEBSOCKET_ADAPTER = TypeAdapter(WebSocketMessage)
+FACE_DATA_ADAPTER = TypeAdapter(FaceData)
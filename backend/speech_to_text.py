@@ -3,10 +3,20 @@ Speech-to-Text module using faster-whisper.
 Provides local transcription without cloud APIs.
 """
 
+import asyncio
+import io
+import logging
+import math
 import tempfile
+import threading
 import os
+from contextlib import suppress
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
+
+import numpy as np
+
+log = logging.getLogger(__name__)
 
 # Try to import faster-whisper
 try:
@@ -14,13 +24,26 @@ try:
     WHISPER_AVAILABLE = True
 except ImportError:
     WHISPER_AVAILABLE = False
-    print("[STT] faster-whisper not installed")
+    log.warning("faster-whisper not installed")
+
+# Optional in-process audio decode: skips the ffmpeg subprocess and
+# temp-file round trip that the path-based API pays per request
+try:
+    import soundfile as sf
+    SOUNDFILE_AVAILABLE = True
+except ImportError:
+    SOUNDFILE_AVAILABLE = False
+
+
+def _tmpfs_dir() -> Optional[str]:
+    """RAM-backed temp dir when the platform has one, else TMPDIR."""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
 
 
 class SpeechToText:
     """Local Whisper-based speech-to-text."""
     
-    def __init__(self, model_size: str = "base"):
+    def __init__(self, model_size: str = "base", cpu_threads: Optional[int] = None):
         """
         Initialize Whisper model.
         Model sizes: tiny, base, small, medium, large
@@ -28,67 +51,210 @@ class SpeechToText:
         """
         self.model = None
         self.model_size = model_size
-        
-        if WHISPER_AVAILABLE:
-            self._load_model()
-    
+        # Encoder throughput scales to ~8 threads; beyond that the
+        # OpenMP pool just fights the server's own thread pool
+        self.cpu_threads = cpu_threads or min(8, os.cpu_count() or 4)
+        # Model loads lazily on first transcription: a session that
+        # never transcribes shouldn't pay ~140MB of weights at startup
+        self._load_lock = threading.Lock()
+        self._load_attempted = False
+
+    def _ensure_model(self):
+        """Load the model on first use; safe under concurrent callers."""
+        if self.model is not None or not WHISPER_AVAILABLE:
+            return
+        with self._load_lock:
+            if self.model is None and not self._load_attempted:
+                self._load_attempted = True
+                self._load_model()
+
+    @staticmethod
+    def _select_device() -> tuple:
+        """
+        Pick (device, compute_type); WHISPER_DEVICE=cuda|cpu overrides.
+        On GPU, int8 weights with fp16 activations run on the INT8
+        tensor cores at int8 quality.
+        """
+        device = os.environ.get("WHISPER_DEVICE")
+        if device is None:
+            try:
+                import ctranslate2
+                device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+            except Exception:
+                device = "cpu"
+        if device == "cuda":
+            return "cuda", "int8_float16"
+        return "cpu", "int8"
+
     def _load_model(self):
         """Load the Whisper model."""
         try:
-            print(f"[STT] Loading Whisper model: {self.model_size}")
-            # Use CPU, int8 quantization for speed
+            device, compute_type = self._select_device()
+            log.info("Loading Whisper model: %s (%s)", self.model_size, device)
+            # WHISPER_CACHE pins downloads to a persistent volume so dev
+            # restarts mmap the converted int8 weights instead of
+            # re-downloading; STT_MODEL may also point directly at a
+            # pre-converted CT2 directory (ct2-transformers-converter)
+            # num_workers=2 lets mel extraction overlap with decode
             self.model = WhisperModel(
                 self.model_size,
-                device="cpu",
-                compute_type="int8"
+                device=device,
+                compute_type=compute_type,
+                cpu_threads=self.cpu_threads,
+                num_workers=2,
+                download_root=os.environ.get("WHISPER_CACHE"),
             )
-            print(f"[STT] Model loaded successfully")
+            if device == "cuda":
+                # One silent second through the model pays the cuDNN
+                # plan-selection cost now instead of on the first request
+                segments, _ = self.model.transcribe(
+                    np.zeros(16000, dtype=np.float32), language="en", beam_size=1
+                )
+                for _ in segments:
+                    pass
+            log.info("Model loaded successfully")
         except Exception as e:
-            print(f"[STT] Failed to load model: {e}")
+            log.error("Failed to load model: %s", e)
             self.model = None
     
-    def transcribe(self, audio_data: bytes, language: str = "en") -> Optional[str]:
+    @staticmethod
+    def _decode_pcm(audio_data: bytes) -> Optional[np.ndarray]:
+        """
+        Decode audio bytes to 16 kHz mono float32 in-process.
+        Returns None when the codec isn't supported, in which case the
+        caller falls back to the temp-file/ffmpeg path.
+        """
+        if not SOUNDFILE_AVAILABLE:
+            return None
+
+        try:
+            data, sr = sf.read(
+                io.BytesIO(audio_data), dtype="float32", always_2d=False
+            )
+        except Exception:
+            return None
+
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+
+        if sr != 16000:
+            try:
+                from scipy.signal import resample_poly
+            except ImportError:
+                return None
+            g = math.gcd(16000, sr)
+            data = resample_poly(data, 16000 // g, sr // g).astype(np.float32)
+
+        return data
+
+    # Below this duration Silero VAD costs more than it saves; the
+    # push-to-talk capture flow produces mostly sub-4s clips
+    VAD_MIN_SECONDS = 4.0
+
+    def _run_transcribe(self, audio: Union[str, np.ndarray],
+                        language: str = "en",
+                        beam_size: int = 1,
+                        vad_filter: Optional[bool] = None) -> Optional[str]:
+        """Transcribe a file path or a 16 kHz float32 waveform."""
+        self._ensure_model()
+        if not self.model:
+            return None
+
+        if vad_filter is None:
+            # Auto: skip VAD for short waveforms, keep it for files
+            # whose duration we'd have to decode to know
+            if isinstance(audio, np.ndarray):
+                vad_filter = len(audio) / 16000.0 >= self.VAD_MIN_SECONDS
+            else:
+                vad_filter = True
+
+        # An unset language triggers a full encoder pass just to detect
+        # it — never let None/"" through
+        language = language or "en"
+
+        try:
+            # Greedy decoding by default: beam-5 costs ~5x per token and
+            # the WER gain on short close-mic utterances is negligible.
+            # Timestamps and cross-segment conditioning are skipped too —
+            # callers only use the joined text.
+            segments, info = self.model.transcribe(
+                audio,
+                language=language,
+                task="transcribe",  # Don't consider translate alternates
+                beam_size=beam_size,
+                temperature=0,  # No fallback-sampling re-runs
+                condition_on_previous_text=False,
+                without_timestamps=True,
+                vad_filter=vad_filter,
+            )
+
+            # Combine segments: Whisper already prefixes each segment
+            # with a space, so concatenate and strip once instead of
+            # stripping (and re-spacing) every segment
+            return "".join(segment.text for segment in segments).strip()
+
+        except Exception as e:
+            log.warning("Transcription error: %s", e)
+            return None
+
+    def transcribe_file(self, audio_path: str, language: str = "en",
+                        beam_size: int = 1) -> Optional[str]:
         """
-        Transcribe audio data to text.
-        
+        Transcribe an audio file on disk.
+
         Args:
-            audio_data: Raw audio bytes (WAV or MP3)
+            audio_path: Path to the audio file (WAV or MP3)
             language: Language code (e.g., "en", "es")
-        
+            beam_size: Decoder beam width (1 = greedy)
+
         Returns:
             Transcribed text or None if failed
         """
+        return self._run_transcribe(audio_path, language=language,
+                                    beam_size=beam_size)
+
+    def transcribe(self, audio_data: bytes, language: str = "en",
+                   beam_size: int = 1) -> Optional[str]:
+        """
+        Transcribe in-memory audio bytes.
+        Decodes to PCM in-process when soundfile can read the format;
+        otherwise spools to a temp file for ffmpeg to handle.
+        """
+        self._ensure_model()
         if not self.model:
             return None
-        
-        # Write audio to temp file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+
+        waveform = self._decode_pcm(audio_data)
+        if waveform is not None:
+            return self._run_transcribe(waveform, language=language,
+                                        beam_size=beam_size)
+
+        # Write audio to a temp file, preferring tmpfs so the spool
+        # never touches actual disk
+        with tempfile.NamedTemporaryFile(
+            suffix=".wav", dir=_tmpfs_dir(), delete=False
+        ) as f:
             f.write(audio_data)
             temp_path = f.name
-        
+
         try:
-            # Transcribe
-            segments, info = self.model.transcribe(
-                temp_path,
-                language=language,
-                beam_size=5,
-                vad_filter=True,  # Voice activity detection
-            )
-            
-            # Combine segments
-            text = " ".join(segment.text.strip() for segment in segments)
-            return text.strip()
-            
-        except Exception as e:
-            print(f"[STT] Transcription error: {e}")
-            return None
-            
+            return self.transcribe_file(temp_path, language=language,
+                                        beam_size=beam_size)
         finally:
             # Clean up temp file
-            try:
+            with suppress(OSError):
                 os.unlink(temp_path)
-            except:
-                pass
+
+    async def transcribe_async(self, audio_data: bytes, language: str = "en",
+                               beam_size: int = 1) -> Optional[str]:
+        """
+        Async wrapper: runs the CPU-heavy transcription in the default
+        executor so the event loop (and the face pipeline on it) keeps
+        flowing.
+        """
+        return await asyncio.to_thread(
+            self.transcribe, audio_data, language, beam_size
+        )
 
 
 # Singleton instance
@@ -99,5 +265,12 @@ def get_stt() -> SpeechToText:
     """Get the singleton STT instance."""
     global _stt
     if _stt is None:
-        _stt = SpeechToText(model_size="base")
+        # Cap BLAS/OpenMP pools before CT2 spins up so STT threads don't
+        # oversubscribe cores the server's executor is already using
+        os.environ.setdefault("OMP_NUM_THREADS", str(min(8, os.cpu_count() or 4)))
+        os.environ.setdefault("MKL_NUM_THREADS", str(min(8, os.cpu_count() or 4)))
+        # tiny.en is near-equivalent to base on short close-mic speech
+        # and the English-only decoder is ~20% faster; STT_MODEL=base
+        # (or distil-small.en, or "tiny" for multilingual) overrides
+        _stt = SpeechToText(model_size=os.environ.get("STT_MODEL", "tiny.en"))
     return _stt